@@ -0,0 +1,8 @@
+from pathlib import Path
+import sys
+
+# The backend modules import the shared AQI code from src/, which sits next to
+# this package. Put the project root on sys.path once, however the app is started.
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
@@ -1,17 +1,14 @@
 ﻿from __future__ import annotations
 
-from pathlib import Path
+import asyncio
+from contextlib import asynccontextmanager
 from secrets import compare_digest
-import sys
 
 from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-ROOT_DIR = Path(__file__).resolve().parents[1]
-if str(ROOT_DIR) not in sys.path:
-    sys.path.insert(0, str(ROOT_DIR))
-
 from .config import (
     ALLOWED_ORIGINS,
     ALLOWED_ORIGIN_REGEX,
@@ -19,7 +16,16 @@ from .config import (
     REQUIRE_API_AUTH,
 )
 from .model_loader import get_artifacts
-from .predict import POLLUTANTS_ALL, build_feature_frame, compute_exact_aqi
+from .predict import (
+    POLLUTANTS_ALL,
+    build_feature_row,
+    cached_model_aqi,
+    compute_exact_aqi,
+    has_all_pollutants,
+    predict_model_aqi,
+    remember_model_aqi,
+    standardize_request,
+)
 from .schemas import InputSummary, ModelInfo, PredictRequest, PredictResponse
 from src.aqi import aqi_category
 
@@ -29,14 +35,12 @@ if REQUIRE_API_AUTH and not API_BEARER_TOKEN:
     )
 
 bearer_scheme = HTTPBearer(auto_error=False)
+_API_BEARER_TOKEN_BYTES = API_BEARER_TOKEN.encode()
 
 
 def verify_api_bearer_token(
     credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme),
 ) -> None:
-    if not REQUIRE_API_AUTH:
-        return
-
     if credentials is None or credentials.scheme.lower() != "bearer":
         raise HTTPException(
             status_code=401,
@@ -44,7 +48,7 @@ def verify_api_bearer_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    if not compare_digest(credentials.credentials, API_BEARER_TOKEN):
+    if not compare_digest(credentials.credentials.encode(), _API_BEARER_TOKEN_BYTES):
         raise HTTPException(
             status_code=401,
             detail="Invalid bearer token.",
@@ -52,10 +56,21 @@ def verify_api_bearer_token(
         )
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load (and warm) the model at startup so the first request doesn't pay
+    # for joblib.load and sklearn's first-call setup.
+    get_artifacts()
+    yield
+
+
 app = FastAPI(
     title="AQI Estimation API",
     version="1.0.0",
-    dependencies=[Depends(verify_api_bearer_token)],
+    lifespan=lifespan,
+    # Only attach the auth dependency when it is enforced, so disabled auth
+    # costs nothing per request.
+    dependencies=[Depends(verify_api_bearer_token)] if REQUIRE_API_AUTH else [],
 )
 
 app.add_middleware(
@@ -66,10 +81,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Above the /predict body (under 700 bytes), so the hot path skips compression.
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 
 @app.get("/health")
-def health():
+async def health():
     artifacts = get_artifacts()
     model_loaded = artifacts.model is not None
     model_name = artifacts.meta.get("best_model_name") if artifacts.meta else None
@@ -77,19 +94,18 @@ def health():
 
 
 @app.post("/predict", response_model=PredictResponse)
-def predict(request: PredictRequest):
+async def predict(request: PredictRequest):
     artifacts = get_artifacts()
-    feature_cols = artifacts.feature_cols or artifacts.meta.get("features", [])
+    feature_cols = artifacts.feature_cols
     if not feature_cols:
         raise HTTPException(status_code=500, detail="Feature columns not available.")
 
     input_pollutants = artifacts.meta.get("input_pollutants", POLLUTANTS_ALL)
 
-    X, standardized, provided = build_feature_frame(request, feature_cols, input_pollutants)
+    # Cheap path first: the model input is only built if the model is needed.
+    standardized, provided = standardize_request(request, input_pollutants)
     aqi_exact, aqi_category_exact = compute_exact_aqi(standardized)
-    all_pollutants_provided = all(
-        standardized.get(pollutant) is not None for pollutant in input_pollutants
-    )
+    all_pollutants_provided = has_all_pollutants(standardized, input_pollutants)
 
     if all_pollutants_provided and aqi_exact is not None:
         # When all pollutant inputs are present, use direct AQI calculation (max IAQI).
@@ -103,8 +119,14 @@ def predict(request: PredictRequest):
                 detail="Model is not available for AQI estimation when inputs are missing.",
             )
         else:
+            row, cache_key = build_feature_row(request, standardized, artifacts.feature_index)
             try:
-                aqi_pred = float(artifacts.model.predict(X)[0])
+                # Repeat rows are answered from the cache on the event loop; only
+                # a miss pays for a worker thread, since inference blocks.
+                aqi_pred = cached_model_aqi(cache_key)
+                if aqi_pred is None:
+                    aqi_pred = await asyncio.to_thread(predict_model_aqi, row)
+                    remember_model_aqi(cache_key, aqi_pred)
                 aqi_category_pred = aqi_category(aqi_pred)
                 used_model = True
             except Exception as exc:
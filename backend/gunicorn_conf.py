@@ -0,0 +1,33 @@
+"""
+Gunicorn settings for serving the API in production.
+
+From the project root:
+    gunicorn -c backend/gunicorn_conf.py backend.app:app
+"""
+
+import multiprocessing
+import os
+
+from uvicorn_worker import UvicornWorker
+
+
+class UvloopWorker(UvicornWorker):
+    # Pin the uvloop event loop and httptools parser rather than relying on "auto".
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+bind = os.getenv("AQI_BIND", "0.0.0.0:8000")
+# One per core; each holds its own model copy unless AQI_PRELOAD is set (see README).
+workers = int(os.getenv("AQI_WORKERS", multiprocessing.cpu_count()))
+worker_class = "backend.gunicorn_conf.UvloopWorker"
+keepalive = 5
+
+# Load the model in the master so workers share it copy-on-write (see README).
+preload_app = os.getenv("AQI_PRELOAD", "false").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def on_starting(server):
+    if preload_app:
+        from backend.model_loader import get_artifacts
+
+        get_artifacts()
@@ -1,12 +1,16 @@
 ﻿from __future__ import annotations
 
 import json
+import threading
 from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
 
 import joblib
+import numpy as np
+import pandas as pd
 
 from .config import FEATURE_COLS_PATH, MODEL_META_PATH, MODEL_PATH
 
@@ -14,8 +18,68 @@ from .config import FEATURE_COLS_PATH, MODEL_META_PATH, MODEL_PATH
 @dataclass(frozen=True)
 class ModelArtifacts:
     model: Optional[Any]
-    feature_cols: List[str]
+    # Model input columns in order (feature_cols.json, else meta["features"]).
+    feature_cols: Tuple[str, ...]
     meta: Dict[str, Any]
+    # Read-only column name -> position map, built once per process.
+    feature_index: Mapping[str, int]
+
+
+class OnnxModel:
+    """Exposes the predict() interface of an sklearn regressor over an ONNX session."""
+
+    def __init__(self, path: Path) -> None:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        self._session = ort.InferenceSession(
+            str(path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_name = self._session.get_inputs()[0].name
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        return self._session.run(None, {self._input_name: X})[0].ravel()
+
+
+def _single_threaded(model: Any) -> Any:
+    # A one-row predict gains nothing from joblib threads, and a thread pool
+    # started before a fork (see AQI_PRELOAD) is not safe to reuse in workers.
+    if hasattr(model, "get_params"):
+        n_jobs = {k: 1 for k in model.get_params() if k == "n_jobs" or k.endswith("__n_jobs")}
+        if n_jobs:
+            model.set_params(**n_jobs)
+    return model
+
+
+def model_input(model: Any, X: np.ndarray, feature_cols: Sequence[str]) -> Any:
+    """
+    X as a DataFrame over feature_cols for estimators fitted on named columns
+    (they check, or with string column selectors require, the names); the
+    bare ndarray otherwise.
+    """
+    if hasattr(model, "feature_names_in_"):
+        return pd.DataFrame(X, columns=list(feature_cols), copy=False)
+    return X
+
+
+def _load_model(path: Path, feature_cols: Sequence[str]) -> Optional[Any]:
+    if not path.exists():
+        return None
+    n_features = len(feature_cols)
+    if path.suffix == ".onnx":
+        model = OnnxModel(path)
+    else:
+        # Each process holds a private copy; see AQI_PRELOAD in the README.
+        model = _single_threaded(joblib.load(path))
+    if not n_features:
+        return model
+
+    # One prediction up front warms the model before the first request.
+    warm_row = np.zeros((1, n_features), dtype=np.float32)
+    model.predict(model_input(model, warm_row, feature_cols))
+    return model
 
 
 def _load_json(path: Path, default: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -35,13 +99,26 @@ def _load_feature_cols(path: Path) -> List[str]:
     return list(data)
 
 
+_buffers = threading.local()
+
+
+def feature_buffer(n_features: int) -> np.ndarray:
+    """Per-thread (1, n_features) float32 scratch row for model input, reused across calls."""
+    buf = getattr(_buffers, "row", None)
+    if buf is None or buf.shape[1] != n_features:
+        buf = np.empty((1, n_features), dtype=np.float32)
+        _buffers.row = buf
+    return buf
+
+
 @lru_cache(maxsize=1)
 def get_artifacts() -> ModelArtifacts:
-    model = None
-    if MODEL_PATH.exists():
-        model = joblib.load(MODEL_PATH)
-
-    feature_cols = _load_feature_cols(FEATURE_COLS_PATH)
     meta = _load_json(MODEL_META_PATH, default={})
+    feature_cols = tuple(_load_feature_cols(FEATURE_COLS_PATH) or meta.get("features", []))
+
+    feature_index = MappingProxyType({col: i for i, col in enumerate(feature_cols)})
+    model = _load_model(MODEL_PATH, feature_cols)
 
-    return ModelArtifacts(model=model, feature_cols=feature_cols, meta=meta)
+    return ModelArtifacts(
+        model=model, feature_cols=feature_cols, meta=meta, feature_index=feature_index
+    )
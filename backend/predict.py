@@ -1,83 +1,162 @@
-﻿from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+﻿from collections import OrderedDict
+from typing import Dict, List, Mapping, Optional, Tuple
 
 import numpy as np
-import pandas as pd
 
-import sys
-
-ROOT_DIR = Path(__file__).resolve().parents[1]
-if str(ROOT_DIR) not in sys.path:
-    sys.path.insert(0, str(ROOT_DIR))
-
-from src.aqi import aqi_category, compute_aqi_row, convert_to_standard
-from src.features import add_time_features
+from src.aqi import POLLUTANT_ORDER, aqi_category, compute_aqi_scalar, convert_to_standard
 
+from .model_loader import feature_buffer, get_artifacts, model_input
 from .schemas import PredictRequest
 
-POLLUTANTS_ALL = ["pm25", "pm10", "no2", "o3", "co", "so2"]
+POLLUTANTS_ALL = list(POLLUTANT_ORDER)
+
+
+# Rounding applied to model inputs to form the prediction cache key (the model
+# itself sees the unrounded row): ~100 m for coordinates and EPA reporting
+# precision for standardized pollutants. Time features are already bucketed to
+# the hour.
+_CACHE_DECIMALS = {
+    "latitude": 3,
+    "longitude": 3,
+    "pm25": 1,
+    "pm10": 0,
+    "no2": 0,
+    "o3": 3,
+    "co": 1,
+    "so2": 0,
+}
+
+# Slot of each pollutant in the fixed-length standardized vector.
+_POL_IDX = {pollutant: i for i, pollutant in enumerate(POLLUTANT_ORDER)}
+
+
+def _request_inputs(
+    request: PredictRequest,
+) -> Tuple[Tuple[Optional[float], ...], Tuple[Optional[str], ...]]:
+    """Pollutant values and units from the request, in POLLUTANTS_ALL order."""
+    p = request.pollutants
+    values = (p.pm25, p.pm10, p.no2, p.o3, p.co, p.so2)
+    u = request.units
+    if u is None:
+        units: Tuple[Optional[str], ...] = (None,) * len(POLLUTANTS_ALL)
+    else:
+        units = (u.pm25, u.pm10, u.no2, u.o3, u.co, u.so2)
+    return values, units
 
 
 def _standardize_pollutants(
-    pollutant_values: Dict[str, Optional[float]],
-    unit_values: Optional[Dict[str, Optional[str]]],
+    pollutant_values: Tuple[Optional[float], ...],
+    unit_values: Tuple[Optional[str], ...],
     pollutant_cols: List[str],
-) -> Dict[str, Optional[float]]:
-    standardized: Dict[str, Optional[float]] = {}
+) -> np.ndarray:
+    # float64 rather than float32: breakpoint edges such as 0.054 ppm must not
+    # round up into the gap before the next range.
+    standardized = np.full(len(POLLUTANT_ORDER), np.nan)
     for pollutant in pollutant_cols:
-        value = pollutant_values.get(pollutant)
-        unit = unit_values.get(pollutant) if unit_values else None
+        pos = _POL_IDX.get(pollutant)
+        if pos is None:
+            continue
+        value = pollutant_values[pos]
+        unit = unit_values[pos]
         if value is None or (isinstance(value, float) and np.isnan(value)):
-            standardized[pollutant] = None
             continue
         if unit:
             converted, _ = convert_to_standard(pollutant, value, unit)
-            standardized[pollutant] = converted
+            if converted is not None:
+                standardized[pos] = converted
         else:
-            standardized[pollutant] = float(value)
+            standardized[pos] = float(value)
     return standardized
 
 
-def build_feature_frame(
-    request: PredictRequest, feature_cols: List[str], pollutant_cols: List[str]
-) -> Tuple[pd.DataFrame, Dict[str, Optional[float]], List[str]]:
-    pollutant_values = request.pollutants.dict()
-    unit_values = request.units.dict() if request.units else {}
-
+def standardize_request(
+    request: PredictRequest, pollutant_cols: List[str]
+) -> Tuple[np.ndarray, List[str]]:
+    """
+    Standard-unit pollutant values in POLLUTANT_ORDER (NaN for missing) and the
+    names of pollutants the request provided.
+    """
+    pollutant_values, unit_values = _request_inputs(request)
     standardized = _standardize_pollutants(pollutant_values, unit_values, pollutant_cols)
-
-    row = {
+    provided = [p for p, v in zip(POLLUTANTS_ALL, pollutant_values) if v is not None]
+    return standardized, provided
+
+
+def has_all_pollutants(standardized: np.ndarray, pollutant_cols: List[str]) -> bool:
+    return all(
+        pollutant in _POL_IDX and not np.isnan(standardized[_POL_IDX[pollutant]])
+        for pollutant in pollutant_cols
+    )
+
+
+def build_feature_row(
+    request: PredictRequest,
+    standardized: np.ndarray,
+    feature_index: Mapping[str, int],
+) -> Tuple[Tuple[Optional[float], ...], Tuple[Optional[float], ...]]:
+    """
+    One model input row in feature order and its quantized copy, which keys
+    the prediction cache. None marks a missing value.
+    """
+    timestamp = request.timestamp
+    values: Dict[str, Optional[float]] = {
         "latitude": request.latitude,
         "longitude": request.longitude,
-        "timestamp": request.timestamp,
+        "hour": timestamp.hour,
+        "day_of_week": timestamp.weekday(),
+        "month": timestamp.month,
     }
-    row.update({p: standardized.get(p) for p in pollutant_cols})
+    for pollutant, value in zip(POLLUTANT_ORDER, standardized.tolist()):
+        missing = np.isnan(value)
+        values[pollutant] = None if missing else value
+        values[f"{pollutant}_is_missing"] = int(missing)
+
+    row: List[Optional[float]] = [None] * len(feature_index)
+    key: List[Optional[float]] = [None] * len(feature_index)
+    for name, value in values.items():
+        pos = feature_index.get(name)
+        if pos is None or value is None:
+            continue
+        row[pos] = float(value)
+        decimals = _CACHE_DECIMALS.get(name)
+        key[pos] = row[pos] if decimals is None else round(value, decimals)
+    return tuple(row), tuple(key)
 
-    df = pd.DataFrame([row])
-    df = add_time_features(df, time_col="timestamp")
 
-    for pollutant in pollutant_cols:
-        df[f"{pollutant}_is_missing"] = df[pollutant].isna().astype(int)
+# Model AQI by feature row, least recently used first. Only touched from the
+# event loop, so a hit never needs a worker thread and there is no locking.
+_PREDICTION_CACHE_SIZE = 4096
+_prediction_cache: "OrderedDict[Tuple[Optional[float], ...], float]" = OrderedDict()
 
-    for col in feature_cols:
-        if col not in df.columns:
-            df[col] = np.nan
 
-    provided = [p for p, v in pollutant_values.items() if v is not None]
+def cached_model_aqi(key: Tuple[Optional[float], ...]) -> Optional[float]:
+    """Memoized model AQI for a cache key from build_feature_row, or None if not cached."""
+    aqi = _prediction_cache.get(key)
+    if aqi is not None:
+        _prediction_cache.move_to_end(key)
+    return aqi
 
-    return df[feature_cols], standardized, provided
 
+def remember_model_aqi(key: Tuple[Optional[float], ...], aqi: float) -> None:
+    _prediction_cache[key] = aqi
+    _prediction_cache.move_to_end(key)
+    if len(_prediction_cache) > _PREDICTION_CACHE_SIZE:
+        _prediction_cache.popitem(last=False)
 
-def compute_exact_aqi(
-    standardized: Dict[str, Optional[float]]
-) -> Tuple[Optional[float], Optional[str]]:
-    row_values = {
-        pollutant: (None if value is None else float(value))
-        for pollutant, value in standardized.items()
-    }
-    has_any = any(value is not None for value in row_values.values())
-    if not has_any:
+
+def predict_model_aqi(row: Tuple[Optional[float], ...]) -> float:
+    """Model AQI for an unrounded row from build_feature_row; blocking, run it off the event loop."""
+    artifacts = get_artifacts()
+    X = feature_buffer(len(row))
+    X[0] = [np.nan if v is None else v for v in row]
+    return float(artifacts.model.predict(model_input(artifacts.model, X, artifacts.feature_cols))[0])
+
+
+def compute_exact_aqi(standardized: np.ndarray) -> Tuple[Optional[float], Optional[str]]:
+    if np.isnan(standardized).all():
         return None, None
 
-    aqi_exact = compute_aqi_row(row_values)
-    return aqi_exact, aqi_category(aqi_exact)
+    aqi_exact = compute_aqi_scalar(*standardized.tolist())
+    if np.isnan(aqi_exact):
+        return None, None
+    return float(aqi_exact), aqi_category(aqi_exact)
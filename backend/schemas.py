@@ -3,10 +3,12 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class Pollutants(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     pm25: Optional[float] = None
     pm10: Optional[float] = None
     no2: Optional[float] = None
@@ -16,6 +18,8 @@ class Pollutants(BaseModel):
 
 
 class Units(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     pm25: Optional[str] = None
     pm10: Optional[str] = None
     no2: Optional[str] = None
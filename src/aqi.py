@@ -1,94 +1,128 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import math
+from functools import lru_cache
 from typing import Dict, Iterable, List, Optional, Tuple
 
 import numpy as np
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the kernels below run as plain Python.
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
 
-@dataclass(frozen=True)
-class Breakpoint:
-    bp_low: float
-    bp_high: float
-    i_low: int
-    i_high: int
 
+# (bp_low, bp_high, i_low, i_high)
+Breakpoint = Tuple[float, float, int, int]
 
 BREAKPOINTS: Dict[str, Dict[str, Iterable[Breakpoint]]] = {
     # US EPA AQI breakpoints
     "pm25": {
         "unit": "ug/m3",
         "table": [
-            Breakpoint(0.0, 12.0, 0, 50),
-            Breakpoint(12.1, 35.4, 51, 100),
-            Breakpoint(35.5, 55.4, 101, 150),
-            Breakpoint(55.5, 150.4, 151, 200),
-            Breakpoint(150.5, 250.4, 201, 300),
-            Breakpoint(250.5, 350.4, 301, 400),
-            Breakpoint(350.5, 500.4, 401, 500),
+            (0.0, 12.0, 0, 50),
+            (12.1, 35.4, 51, 100),
+            (35.5, 55.4, 101, 150),
+            (55.5, 150.4, 151, 200),
+            (150.5, 250.4, 201, 300),
+            (250.5, 350.4, 301, 400),
+            (350.5, 500.4, 401, 500),
         ],
     },
     "pm10": {
         "unit": "ug/m3",
         "table": [
-            Breakpoint(0, 54, 0, 50),
-            Breakpoint(55, 154, 51, 100),
-            Breakpoint(155, 254, 101, 150),
-            Breakpoint(255, 354, 151, 200),
-            Breakpoint(355, 424, 201, 300),
-            Breakpoint(425, 504, 301, 400),
-            Breakpoint(505, 604, 401, 500),
+            (0, 54, 0, 50),
+            (55, 154, 51, 100),
+            (155, 254, 101, 150),
+            (255, 354, 151, 200),
+            (355, 424, 201, 300),
+            (425, 504, 301, 400),
+            (505, 604, 401, 500),
         ],
     },
     "o3": {
         "unit": "ppm",
         "table": [
-            Breakpoint(0.000, 0.054, 0, 50),
-            Breakpoint(0.055, 0.070, 51, 100),
-            Breakpoint(0.071, 0.085, 101, 150),
-            Breakpoint(0.086, 0.105, 151, 200),
-            Breakpoint(0.106, 0.200, 201, 300),
-            Breakpoint(0.201, 0.604, 301, 500),
+            (0.000, 0.054, 0, 50),
+            (0.055, 0.070, 51, 100),
+            (0.071, 0.085, 101, 150),
+            (0.086, 0.105, 151, 200),
+            (0.106, 0.200, 201, 300),
+            (0.201, 0.604, 301, 500),
         ],
     },
     "co": {
         "unit": "ppm",
         "table": [
-            Breakpoint(0.0, 4.4, 0, 50),
-            Breakpoint(4.5, 9.4, 51, 100),
-            Breakpoint(9.5, 12.4, 101, 150),
-            Breakpoint(12.5, 15.4, 151, 200),
-            Breakpoint(15.5, 30.4, 201, 300),
-            Breakpoint(30.5, 40.4, 301, 400),
-            Breakpoint(40.5, 50.4, 401, 500),
+            (0.0, 4.4, 0, 50),
+            (4.5, 9.4, 51, 100),
+            (9.5, 12.4, 101, 150),
+            (12.5, 15.4, 151, 200),
+            (15.5, 30.4, 201, 300),
+            (30.5, 40.4, 301, 400),
+            (40.5, 50.4, 401, 500),
         ],
     },
     "so2": {
         "unit": "ppb",
         "table": [
-            Breakpoint(0, 35, 0, 50),
-            Breakpoint(36, 75, 51, 100),
-            Breakpoint(76, 185, 101, 150),
-            Breakpoint(186, 304, 151, 200),
-            Breakpoint(305, 604, 201, 300),
-            Breakpoint(605, 804, 301, 400),
-            Breakpoint(805, 1004, 401, 500),
+            (0, 35, 0, 50),
+            (36, 75, 51, 100),
+            (76, 185, 101, 150),
+            (186, 304, 151, 200),
+            (305, 604, 201, 300),
+            (605, 804, 301, 400),
+            (805, 1004, 401, 500),
         ],
     },
     "no2": {
         "unit": "ppb",
         "table": [
-            Breakpoint(0, 53, 0, 50),
-            Breakpoint(54, 100, 51, 100),
-            Breakpoint(101, 360, 101, 150),
-            Breakpoint(361, 649, 151, 200),
-            Breakpoint(650, 1249, 201, 300),
-            Breakpoint(1250, 1649, 301, 400),
-            Breakpoint(1650, 2049, 401, 500),
+            (0, 53, 0, 50),
+            (54, 100, 51, 100),
+            (101, 360, 101, 150),
+            (361, 649, 151, 200),
+            (650, 1249, 201, 300),
+            (1250, 1649, 301, 400),
+            (1650, 2049, 401, 500),
         ],
     },
 }
 
+
+def _breakpoint_arrays(table: Iterable[Breakpoint]) -> Dict[str, np.ndarray]:
+    low, high, i_low, i_high = np.array(list(table), dtype=np.float64).T
+    return {"low": low, "high": high, "ilow": i_low, "ihigh": i_high}
+
+
+# Parallel breakpoint arrays for the vectorized IAQI path.
+_BP: Dict[str, Dict[str, np.ndarray]] = {
+    pollutant: _breakpoint_arrays(spec["table"]) for pollutant, spec in BREAKPOINTS.items()
+}
+
+# Argument order of compute_aqi_scalar.
+POLLUTANT_ORDER = ("pm25", "pm10", "no2", "o3", "co", "so2")
+
+
+def _padded_table(key: str) -> np.ndarray:
+    width = max(len(_BP[p][key]) for p in POLLUTANT_ORDER)
+    table = np.full((len(POLLUTANT_ORDER), width), np.nan)
+    for i, pollutant in enumerate(POLLUTANT_ORDER):
+        column = _BP[pollutant][key]
+        table[i, : len(column)] = column
+    return table
+
+
+# One row per pollutant in POLLUTANT_ORDER, NaN-padded to equal width.
+_BP_LOW = _padded_table("low")
+_BP_HIGH = _padded_table("high")
+_BP_ILOW = _padded_table("ilow")
+_BP_IHIGH = _padded_table("ihigh")
+
 MOLECULAR_WEIGHTS = {
     "o3": 48.00,
     "no2": 46.01,
@@ -106,40 +140,41 @@ def _ppm_to_ugm3(value_ppm: float, mw: float) -> float:
     return (value_ppm * mw * 1000.0) / 24.45
 
 
-def _normalize_unit(unit: Optional[str]) -> Optional[str]:
+# Fold the micro sign and superscript three in one pass, then map the
+# remaining spelling variants to the canonical unit.
+_UNIT_TRANSLATION = str.maketrans({"\u00b5": "u", "\u00b3": "3"})
+_UNIT_ALIAS = {
+    "ug/m^3": "ug/m3",
+    "mg/m^3": "mg/m3",
+}
+
+
+def normalize_unit(unit: Optional[str]) -> Optional[str]:
     if unit is None:
         return None
-    unit = unit.strip().lower()
-    unit = unit.replace("\u00b5", "u")
-    unit = unit.replace("ug/m^3", "ug/m3")
-    unit = unit.replace("ug/m\u00b3", "ug/m3")
-    unit = unit.replace("mg/m\u00b3", "mg/m3")
-    return unit
+    return _normalize_unit_text(str(unit))
 
 
-def convert_to_standard(
-    pollutant: str, value: Optional[float], unit: Optional[str]
-) -> Tuple[Optional[float], Optional[str]]:
-    """
-    Convert a concentration to the standard unit expected by BREAKPOINTS.
-    Returns (value, unit) in standard units or (None, None) if conversion fails.
-    """
-    if value is None or (isinstance(value, float) and np.isnan(value)):
-        return None, None
-    if pollutant not in BREAKPOINTS:
-        return None, None
+@lru_cache(maxsize=512)
+def _normalize_unit_text(text: str) -> str:
+    # Keyed on the string form so any input, NaN included, is hashable.
+    text = text.strip().lower().translate(_UNIT_TRANSLATION)
+    return _UNIT_ALIAS.get(text, text)
+
 
-    unit = _normalize_unit(unit)
+def _convert(pollutant: str, value, unit: Optional[str]):
+    # Shared by the scalar and array conversions; value is a float or an
+    # ndarray and unit is already normalized.
     target_unit = BREAKPOINTS[pollutant]["unit"]
 
     if unit == target_unit:
-        return float(value), target_unit
+        return value, target_unit
 
     if pollutant in ("pm25", "pm10"):
         if unit == "mg/m3":
-            return float(value) * 1000.0, target_unit
+            return value * 1000.0, target_unit
         if unit == "ug/m3":
-            return float(value), target_unit
+            return value, target_unit
         return None, None
 
     mw = MOLECULAR_WEIGHTS.get(pollutant)
@@ -148,27 +183,56 @@ def convert_to_standard(
 
     if target_unit == "ppm":
         if unit == "ppb":
-            return float(value) / 1000.0, target_unit
+            return value / 1000.0, target_unit
         if unit == "ug/m3":
-            return _ugm3_to_ppm(float(value), mw), target_unit
+            return _ugm3_to_ppm(value, mw), target_unit
         if unit == "mg/m3":
-            return _ugm3_to_ppm(float(value) * 1000.0, mw), target_unit
+            return _ugm3_to_ppm(value * 1000.0, mw), target_unit
         if unit == "ppm":
-            return float(value), target_unit
+            return value, target_unit
 
     if target_unit == "ppb":
         if unit == "ppm":
-            return float(value) * 1000.0, target_unit
+            return value * 1000.0, target_unit
         if unit == "ug/m3":
-            return _ugm3_to_ppm(float(value), mw) * 1000.0, target_unit
+            return _ugm3_to_ppm(value, mw) * 1000.0, target_unit
         if unit == "mg/m3":
-            return _ugm3_to_ppm(float(value) * 1000.0, mw) * 1000.0, target_unit
+            return _ugm3_to_ppm(value * 1000.0, mw) * 1000.0, target_unit
         if unit == "ppb":
-            return float(value), target_unit
+            return value, target_unit
 
     return None, None
 
 
+def convert_to_standard(
+    pollutant: str, value: Optional[float], unit: Optional[str]
+) -> Tuple[Optional[float], Optional[str]]:
+    """
+    Convert a concentration to the standard unit expected by BREAKPOINTS.
+    Returns (value, unit) in standard units or (None, None) if conversion fails.
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None, None
+    if pollutant not in BREAKPOINTS:
+        return None, None
+
+    return _convert(pollutant, float(value), normalize_unit(unit))
+
+
+def convert_array_to_standard(
+    pollutant: str, values: np.ndarray, unit: Optional[str]
+) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """
+    Array version of convert_to_standard for values sharing one pollutant and unit.
+    NaN values stay NaN; returns (None, None) if the unit cannot be converted.
+    """
+    if pollutant not in BREAKPOINTS:
+        return None, None
+
+    values = np.asarray(values, dtype=np.float64)
+    return _convert(pollutant, values, normalize_unit(unit))
+
+
 def compute_iaqi(
     pollutant: str, concentration: Optional[float], unit: Optional[str] = None
 ) -> Optional[float]:
@@ -182,15 +246,58 @@ def compute_iaqi(
     if converted is None or converted_unit is None:
         return None
 
-    for bp in BREAKPOINTS[pollutant]["table"]:
-        if bp.bp_low <= converted <= bp.bp_high:
-            return ((bp.i_high - bp.i_low) / (bp.bp_high - bp.bp_low)) * (
-                converted - bp.bp_low
-            ) + bp.i_low
+    for bp_low, bp_high, i_low, i_high in BREAKPOINTS[pollutant]["table"]:
+        if bp_low <= converted <= bp_high:
+            return ((i_high - i_low) / (bp_high - bp_low)) * (converted - bp_low) + i_low
 
     return None
 
 
+def compute_iaqi_vec(pollutant: str, values: np.ndarray) -> np.ndarray:
+    """
+    Vectorized IAQI for concentrations already in the standard unit.
+    Values that fall outside every breakpoint range (or are NaN) map to NaN.
+    """
+    bp = _BP[pollutant]
+    low, high, i_low, i_high = bp["low"], bp["high"], bp["ilow"], bp["ihigh"]
+    values = np.asarray(values, dtype=np.float64)
+
+    idx = np.searchsorted(high, values, side="left")
+    out_of_range = idx >= len(high)
+    idx = np.minimum(idx, len(high) - 1)
+
+    lo, hi, ilo, ihi = low[idx], high[idx], i_low[idx], i_high[idx]
+    iaqi = ((ihi - ilo) / (hi - lo)) * (values - lo) + ilo
+    return np.where(out_of_range | (values < lo), np.nan, iaqi)
+
+
+@njit(cache=True)
+def _iaqi(value, low, high, i_low, i_high):
+    for i in range(low.shape[0]):
+        if low[i] <= value <= high[i]:
+            return ((i_high[i] - i_low[i]) / (high[i] - low[i])) * (value - low[i]) + i_low[i]
+    return np.nan
+
+
+@njit(cache=True)
+def compute_aqi_scalar(pm25, pm10, no2, o3, co, so2):
+    """
+    AQI (max IAQI) from six standard-unit concentrations; NaN marks a missing
+    pollutant. Returns NaN when no pollutant falls inside a breakpoint range.
+    """
+    values = (pm25, pm10, no2, o3, co, so2)
+    aqi = np.nan
+    for i in range(len(values)):
+        iaqi = _iaqi(values[i], _BP_LOW[i], _BP_HIGH[i], _BP_ILOW[i], _BP_IHIGH[i])
+        if not np.isnan(iaqi) and (np.isnan(aqi) or iaqi > aqi):
+            aqi = iaqi
+    return aqi
+
+
+# Compile on import so the first request does not pay the JIT cost.
+compute_aqi_scalar(12.0, 54.0, 53.0, 0.054, 4.4, 35.0)
+
+
 def compute_aqi_row(
     row_values: Dict[str, Optional[float]],
     units: Optional[Dict[str, Optional[str]]] = None,
@@ -207,11 +314,11 @@ def compute_aqi_row(
             iaqis.append(iaqi)
     if not iaqis:
         return None
-    return float(np.max(iaqis))
+    return float(max(iaqis))
 
 
 def aqi_category(aqi: Optional[float]) -> Optional[str]:
-    if aqi is None or (isinstance(aqi, float) and np.isnan(aqi)):
+    if aqi is None or (isinstance(aqi, float) and math.isnan(aqi)):
         return None
     if aqi <= 50:
         return "Good"
@@ -228,17 +335,41 @@ def aqi_category(aqi: Optional[float]) -> Optional[str]:
     return "Hazardous"
 
 
+_CATEGORY_BINS = np.array([50, 100, 150, 200, 300])
+_CATEGORY_LABELS = np.array(
+    [
+        "Good",
+        "Moderate",
+        "Unhealthy for Sensitive Groups",
+        "Unhealthy",
+        "Very Unhealthy",
+        "Hazardous",
+    ],
+    dtype=object,
+)
+
+
+def aqi_category_vec(aqi: np.ndarray) -> np.ndarray:
+    """Vectorized aqi_category; NaN maps to None."""
+    aqi = np.asarray(aqi, dtype=np.float64)
+    categories = _CATEGORY_LABELS[np.digitize(aqi, _CATEGORY_BINS, right=True)]
+    categories[np.isnan(aqi)] = None
+    return categories
+
+
 def compute_aqi_dataframe(df, pollutant_cols: Optional[List[str]] = None):
     if pollutant_cols is None:
         pollutant_cols = list(BREAKPOINTS.keys())
 
-    aqi_values = []
-    for _, row in df.iterrows():
-        row_values = {p: row.get(p) for p in pollutant_cols}
-        aqi = compute_aqi_row(row_values)
-        aqi_values.append(aqi)
+    cols = [p for p in pollutant_cols if p in BREAKPOINTS and p in df.columns]
+    aqi_values = np.full(len(df), np.nan)
+    if cols:
+        values = df[cols].to_numpy(dtype=np.float64, na_value=np.nan)
+        iaqi_mat = np.vstack([compute_iaqi_vec(p, values[:, j]) for j, p in enumerate(cols)])
+        has_any = ~np.isnan(iaqi_mat).all(axis=0)
+        aqi_values[has_any] = np.nanmax(iaqi_mat[:, has_any], axis=0)
 
     df = df.copy()
     df["aqi"] = aqi_values
-    df["aqi_category"] = df["aqi"].apply(aqi_category)
+    df["aqi_category"] = aqi_category_vec(aqi_values)
     return df
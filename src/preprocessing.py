@@ -1,16 +1,32 @@
 from __future__ import annotations
 
+import csv
+import hashlib
+import importlib.util
+import io
+import logging
+import os
 import re
-from typing import Optional, Tuple
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
-from src.aqi import convert_to_standard
+from src.aqi import convert_array_to_standard, normalize_unit
 
 
+logger = logging.getLogger(__name__)
+
 POLLUTANTS = {"pm25", "pm10", "no2", "o3", "co", "so2"}
 
+_COORD_RE = re.compile(r"-?\d+\.\d+|-?\d+")
+# The first two numbers _COORD_RE.findall would return, in a single match: the
+# lookaheads stop a number from being cut short to make room for the second.
+_COORD_NUMBER = r"-?\d+\.\d+(?!\d)|-?\d+(?!\d|\.\d)"
+_COORD_PAIR_RE = re.compile(rf"(?s)({_COORD_NUMBER}).*?({_COORD_NUMBER})")
+
 
 def _normalize_col_name(name: str) -> str:
     name = name.strip().lower()
@@ -24,27 +40,38 @@ def normalize_pollutant_name(p: Optional[str]) -> str:
     """
     if p is None:
         return ""
-    text = str(p).strip().lower()
+    return _normalize_pollutant_text(str(p))
+
+
+@lru_cache(maxsize=512)
+def _normalize_pollutant_text(text: str) -> str:
+    text = text.strip().lower()
     compact = text.replace(" ", "").replace("_", "").replace("-", "")
     if compact == "pm2.5" or compact == "pm25":
         return "pm25"
     return compact
 
 
+def _standard_column_name(norm: str) -> Optional[str]:
+    if norm in ("country", "city", "location", "coordinates", "pollutant", "value", "unit"):
+        return norm
+    if norm in ("source_name", "source"):
+        return "source_name"
+    if norm in ("last_updated", "last_updated_utc", "datetime"):
+        return "last_updated"
+    return None
+
+
 def standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
     normalized = {_normalize_col_name(c): c for c in df.columns}
     rename_map = {}
     for norm, original in normalized.items():
-        if norm in ("country", "city", "location", "coordinates", "pollutant", "value"):
-            rename_map[original] = norm
-        elif norm in ("unit",):
-            rename_map[original] = "unit"
-        elif norm in ("source_name", "source"):
-            rename_map[original] = "source_name"
-        elif norm in ("last_updated", "last_updated_utc", "datetime"):
-            rename_map[original] = "last_updated"
-    df = df.rename(columns=rename_map)
+        standard = _standard_column_name(norm)
+        if standard is not None:
+            rename_map[original] = standard
+    # The result shares column data with the input; callers replace columns
+    # rather than writing into them, so the input is never modified.
+    df = df.rename(columns=rename_map, copy=False)
     return df
 
 
@@ -54,31 +81,76 @@ def parse_coordinates(value: Optional[str]) -> Tuple[Optional[float], Optional[f
     if isinstance(value, (list, tuple)) and len(value) >= 2:
         return float(value[0]), float(value[1])
     text = str(value)
-    numbers = re.findall(r"-?\d+\.\d+|-?\d+", text)
+    numbers = _COORD_RE.findall(text)
     if len(numbers) >= 2:
         return float(numbers[0]), float(numbers[1])
     return None, None
 
 
-def normalize_unit(unit: Optional[str]) -> Optional[str]:
-    if unit is None:
-        return None
-    unit = str(unit).strip().lower()
-    unit = unit.replace("\u00b5", "u")
-    unit = unit.replace("ug/m^3", "ug/m3")
-    unit = unit.replace("ug/m\u00b3", "ug/m3")
-    unit = unit.replace("mg/m\u00b3", "mg/m3")
-    return unit
+def _map_unique(series: pd.Series, func) -> pd.Series:
+    # Columns like pollutant and unit hold a handful of distinct strings, so
+    # call func once per distinct value and broadcast back by code.
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    mapped = np.array([func(value) for value in uniques], dtype=object)
+    return pd.Series(mapped[codes], index=series.index)
+
+
+def _parse_coordinate_column(coords: pd.Series) -> pd.DataFrame:
+    # Vectorized parse_coordinates: the first two numbers in each cell, or NaN
+    # for both when fewer than two are present.
+    lat_lon = coords.astype(str).str.extract(_COORD_PAIR_RE).astype(float)
+    # List/tuple cells (never produced by read_csv) go through the scalar parser.
+    is_seq = coords.map(type).isin((list, tuple))
+    if is_seq.any():
+        lat_lon.loc[is_seq] = coords[is_seq].map(parse_coordinates).tolist()
+    return lat_lon
+
+
+def _convert_values(df: pd.DataFrame) -> Tuple[pd.Series, pd.Series]:
+    # Conversion depends only on the (pollutant, unit) pair and there are few
+    # distinct pairs, so each pair's values are converted as one array.
+    codes, pairs = pd.factorize(pd.MultiIndex.from_arrays([df["pollutant"], df["unit"]]))
+    values = df["value"].to_numpy(dtype=np.float64)
+    value_std = np.full(len(values), np.nan)
+    unit_std = np.full(len(values), None, dtype=object)
+    for code, (pollutant, unit) in enumerate(pairs):
+        if pollutant not in POLLUTANTS:
+            continue
+        rows = codes == code
+        converted, target_unit = convert_array_to_standard(pollutant, values[rows], unit)
+        if converted is None:
+            continue
+        value_std[rows] = converted
+        unit_std[rows] = target_unit
+    return pd.Series(value_std, index=df.index), pd.Series(unit_std, index=df.index)
+
+
+def _sniff_delimiter(sample: str) -> str:
+    # OpenAQ exports usually use ";"; ties go to it, otherwise the most frequent wins.
+    return max(";,\t", key=sample.count)
 
 
 def load_raw_data(path: str) -> pd.DataFrame:
-    # OpenAQ exports often use semicolon delimiters; allow fallback sniffing.
-    try:
-        df = pd.read_csv(path, sep=";", encoding="utf-8")
-        if df.shape[1] <= 1:
-            raise ValueError("Unexpected delimiter; falling back to sniffing.")
-    except Exception:
-        df = pd.read_csv(path, sep=None, engine="python", encoding="utf-8")
+    with open(path, encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+    sep = _sniff_delimiter(sample)
+    header = next(csv.reader(io.StringIO(sample), delimiter=sep), [])
+
+    # Only read the columns clean_raw_data uses; the low-cardinality string
+    # columns are parsed straight to categoricals.
+    dtype = {
+        c: "category"
+        for c in header
+        if _standard_column_name(_normalize_col_name(c)) in ("pollutant", "unit")
+    }
+    df = pd.read_csv(
+        path,
+        sep=sep,
+        engine="c",
+        encoding="utf-8",
+        usecols=lambda c: _standard_column_name(_normalize_col_name(c)) is not None,
+        dtype=dtype,
+    )
     df = standardize_columns(df)
     return df
 
@@ -86,32 +158,28 @@ def load_raw_data(path: str) -> pd.DataFrame:
 def clean_raw_data(df: pd.DataFrame) -> pd.DataFrame:
     df = standardize_columns(df)
 
-    raw_pollutants = df["pollutant"].copy()
-    df["pollutant"] = df["pollutant"].apply(normalize_pollutant_name)
-    df = df[df["pollutant"].isin(POLLUTANTS)]
-    raw_has_pm25 = raw_pollutants.apply(normalize_pollutant_name).eq("pm25").any()
+    df["pollutant"] = _map_unique(df["pollutant"], normalize_pollutant_name)
+    # Only needed for the assert below, which python -O strips.
+    raw_has_pm25 = __debug__ and df["pollutant"].eq("pm25").any()
 
-    df["unit"] = df["unit"].apply(normalize_unit)
+    df["unit"] = _map_unique(df["unit"], normalize_unit)
     df["value"] = pd.to_numeric(df["value"], errors="coerce")
 
-    df["timestamp"] = pd.to_datetime(df["last_updated"], errors="coerce", utc=True)
-    df["timestamp"] = df["timestamp"].dt.tz_convert(None)
-
-    lat_lon = df["coordinates"].apply(parse_coordinates)
-    df["latitude"] = lat_lon.apply(lambda x: x[0])
-    df["longitude"] = lat_lon.apply(lambda x: x[1])
+    df["timestamp"] = pd.to_datetime(
+        df["last_updated"], errors="coerce", utc=True, format="ISO8601", cache=True
+    ).dt.tz_localize(None)
 
-    converted = df.apply(
-        lambda row: convert_to_standard(row["pollutant"], row["value"], row["unit"]),
-        axis=1,
-        result_type="expand",
-    )
-    converted.columns = ["value_std", "unit_std"]
-    df = pd.concat([df, converted], axis=1)
+    lat_lon = _parse_coordinate_column(df["coordinates"])
+    df["latitude"] = lat_lon[0]
+    df["longitude"] = lat_lon[1]
 
-    df = df.dropna(subset=["timestamp", "value_std"])
+    df["value_std"], df["unit_std"] = _convert_values(df)
 
-    df = df.drop_duplicates(
+    # Rows that fail a filter can never duplicate one that passes (they differ
+    # in pollutant, timestamp or value_std), so duplicates are found on the
+    # whole frame and everything is applied in a single take.
+    keep = df["pollutant"].isin(POLLUTANTS) & df["timestamp"].notna() & df["value_std"].notna()
+    keep &= ~df.duplicated(
         subset=[
             "timestamp",
             "location",
@@ -135,19 +203,55 @@ def clean_raw_data(df: pd.DataFrame) -> pd.DataFrame:
         "source_name",
     ]
     keep_cols = [c for c in keep_cols if c in df.columns]
-    df = df[keep_cols]
-
-    print("Pollutant counts after cleaning:")
-    print(df["pollutant"].value_counts(dropna=False))
+    df = df.loc[keep, keep_cols]
+    # Repeated strings as categoricals: integer codes to hash when grouping.
+    for c in ("country", "city", "location", "source_name", "pollutant", "unit_std"):
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Pollutant counts after cleaning:\n%s", df["pollutant"].value_counts(dropna=False))
     if raw_has_pm25:
         assert df["pollutant"].eq("pm25").any(), "pm25 present in raw data but missing after cleaning"
     return df
 
 
+# Part of the cache key; bump it when clean_raw_data's output changes.
+_CLEAN_CACHE_VERSION = 1
+
+
+def load_or_clean(
+    path: Union[str, Path], cache_dir: Optional[Union[str, Path]] = None
+) -> pd.DataFrame:
+    """
+    clean_raw_data(load_raw_data(path)), cached as Parquet in cache_dir
+    (default: .cache next to the CSV). The key covers the file's path, mtime and
+    size, so a changed export is cleaned again. Without pyarrow nothing is cached.
+    """
+    stat = os.stat(path)
+    fingerprint = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{_CLEAN_CACHE_VERSION}"
+    key = hashlib.sha1(fingerprint.encode()).hexdigest()
+    cache_dir = Path(cache_dir) if cache_dir is not None else Path(path).parent / ".cache"
+    cache_path = cache_dir / f"{key}.parquet"
+
+    has_pyarrow = importlib.util.find_spec("pyarrow") is not None
+    if has_pyarrow and cache_path.exists():
+        return pd.read_parquet(cache_path, engine="pyarrow")
+
+    df = clean_raw_data(load_raw_data(str(path)))
+    if has_pyarrow:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so a reader never sees a partial file.
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        df.to_parquet(tmp_path, engine="pyarrow", compression="zstd")
+        os.replace(tmp_path, cache_path)
+    return df
+
+
 def aggregate_and_pivot(df_long: pd.DataFrame, freq: str = "D") -> pd.DataFrame:
-    df = df_long.copy()
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-    df["timestamp"] = df["timestamp"].dt.floor(freq)
+    # Shallow copy: the timestamp column is replaced, not written into.
+    df = df_long.copy(deep=False)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce").dt.floor(freq)
 
     preferred_keys = ["source_name", "location", "latitude", "longitude", "timestamp"]
     fallback_keys = ["location", "latitude", "longitude", "timestamp"]
@@ -158,28 +262,48 @@ def aggregate_and_pivot(df_long: pd.DataFrame, freq: str = "D") -> pd.DataFrame:
     if not stable_keys:
         raise ValueError("No stable keys found for aggregation.")
 
-    group_cols = stable_keys + ["pollutant"]
-    grouped = df.groupby(group_cols, dropna=False)["value_std"].mean().reset_index()
-
-    wide = grouped.pivot_table(
-        index=stable_keys,
-        columns="pollutant",
-        values="value_std",
-        aggfunc="mean",
-    ).reset_index()
+    # Rows with a missing key are dropped, as pivot_table's default did.
+    df = df.dropna(subset=stable_keys)
+
+    # Group on integer codes instead of strings and float pairs: string keys
+    # become categoricals and each distinct (latitude, longitude) pair one code.
+    # Both codes are sorted, so the rows come out ordered by key.
+    group_keys = list(stable_keys)
+    for k in ("source_name", "location"):
+        if k in group_keys:
+            df[k] = df[k].astype("category")
+    coords = None
+    if "latitude" in group_keys and "longitude" in group_keys:
+        codes, coords = pd.factorize(
+            pd.MultiIndex.from_arrays([df["latitude"], df["longitude"]]), sort=True
+        )
+        df["_coord"] = codes
+        group_keys = [k for k in group_keys if k != "longitude"]
+        group_keys[group_keys.index("latitude")] = "_coord"
+
+    group_cols = group_keys + ["pollutant"]
+    wide = (
+        df.groupby(group_cols, observed=True)["value_std"]
+        .mean()
+        .unstack("pollutant")
+        .reset_index()
+    )
 
     extra_cols = [c for c in ["country", "city"] if c in df.columns]
     if extra_cols:
-        def _first_non_null(series: pd.Series):
-            series = series.dropna()
-            return series.iloc[0] if not series.empty else np.nan
-
+        # First non-null value of each column per group.
         meta = (
-            df.groupby(stable_keys, dropna=False)[extra_cols]
-            .agg(_first_non_null)
+            df.groupby(group_keys, sort=False, observed=True)[extra_cols]
+            .first()
             .reset_index()
         )
-        wide = wide.merge(meta, on=stable_keys, how="left")
+        wide = wide.merge(meta, on=group_keys, how="left")
+
+    if coords is not None:
+        position = wide.columns.get_loc("_coord")
+        pairs = coords[wide.pop("_coord").to_numpy()]
+        wide.insert(position, "latitude", pairs.get_level_values(0))
+        wide.insert(position + 1, "longitude", pairs.get_level_values(1))
 
     wide.columns.name = None
     return wide
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-from typing import Dict, Tuple
+from pathlib import Path
+from typing import Dict, Tuple, Union
 
+import joblib
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
 from sklearn.impute import SimpleImputer
 from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import GridSearchCV, TimeSeriesSplit
@@ -14,10 +16,31 @@ from sklearn.pipeline import Pipeline
 def train_test_split_time(
     df: pd.DataFrame, time_col: str = "timestamp", test_size: float = 0.2
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
-    df = df.sort_values(time_col)
+    """
+    Split df into train and test frames by time, the last test_size share going to test.
+    Both results are .iloc selections, not copies: pandas treats writes to them as
+    writes to a slice (SettingWithCopyWarning), so call .copy() before mutating.
+    """
     split_index = int(len(df) * (1 - test_size))
-    train_df = df.iloc[:split_index].copy()
-    test_df = df.iloc[split_index:].copy()
+    times = df[time_col]
+    if not pd.api.types.is_datetime64_dtype(times.dtype):
+        # tz-aware, string or other columns: keep the plain sort.
+        df = df.sort_values(time_col)
+        return df.iloc[:split_index], df.iloc[split_index:]
+    # NaT sorts last, as with sort_values.
+    ts = np.where(times.isna(), np.iinfo(np.int64).max, times.to_numpy().view("int64"))
+
+    # Partition around the split instead of sorting everything; only the train
+    # rows are put in time order, since TimeSeriesSplit relies on it. Test rows
+    # keep partition order.
+    if 0 < split_index < len(df):
+        order = np.argpartition(ts, split_index)
+    else:
+        order = np.arange(len(df))
+    train_idx = order[:split_index]
+    train_idx = train_idx[np.argsort(ts[train_idx], kind="stable")]
+    train_df = df.iloc[train_idx]
+    test_df = df.iloc[order[split_index:]]
     return train_df, test_df
 
 
@@ -31,15 +54,16 @@ def build_baseline_model() -> Pipeline:
 
 
 def build_tree_model(random_state: int = 42) -> Pipeline:
+    # HistGradientBoostingRegressor handles missing values itself, so no imputer.
     return Pipeline(
         steps=[
-            ("imputer", SimpleImputer(strategy="median")),
             (
                 "model",
-                RandomForestRegressor(
-                    n_estimators=300,
+                HistGradientBoostingRegressor(
+                    max_iter=300,
+                    learning_rate=0.05,
+                    early_stopping=True,
                     random_state=random_state,
-                    n_jobs=-1,
                 ),
             ),
         ]
@@ -53,16 +77,18 @@ def tune_tree_model(
 ) -> Tuple[Pipeline, Dict[str, float]]:
     pipeline = Pipeline(
         steps=[
-            ("imputer", SimpleImputer(strategy="median")),
-            ("model", RandomForestRegressor(random_state=random_state, n_jobs=-1)),
+            (
+                "model",
+                HistGradientBoostingRegressor(early_stopping=True, random_state=random_state),
+            ),
         ]
     )
 
     param_grid = {
-        "model__n_estimators": [200, 400],
-        "model__max_depth": [None, 10, 20],
-        "model__min_samples_split": [2, 5],
-        "model__min_samples_leaf": [1, 2],
+        "model__max_iter": [200, 400],
+        "model__max_depth": [None, 8, 16],
+        "model__learning_rate": [0.05, 0.1],
+        "model__min_samples_leaf": [20, 50],
     }
 
     cv = TimeSeriesSplit(n_splits=3)
@@ -73,5 +99,29 @@ def tune_tree_model(
         scoring="neg_mean_absolute_error",
         n_jobs=-1,
     )
-    grid.fit(X_train, y_train)
+    # One level of parallelism: the grid spreads fits over loky workers and
+    # each worker's HistGradientBoostingRegressor runs single-threaded, rather
+    # than every worker starting an OpenMP thread per core.
+    with joblib.parallel_config(backend="loky", inner_max_num_threads=1):
+        grid.fit(X_train, y_train)
     return grid.best_estimator_, grid.best_params_
+
+
+def export_onnx(
+    model: Pipeline, n_features: int, path: Union[str, Path]
+) -> Path:
+    """
+    Convert a fitted pipeline to ONNX for the backend's onnxruntime loader.
+    Requires skl2onnx, which is only needed offline.
+    """
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+
+    onnx_model = convert_sklearn(
+        model,
+        initial_types=[("X", FloatTensorType([None, n_features]))],
+        target_opset={"": 17, "ai.onnx.ml": 3},
+    )
+    path = Path(path)
+    path.write_bytes(onnx_model.SerializeToString())
+    return path